@@ -1,22 +1,79 @@
-from flask import Flask, request, jsonify
+import os
+
+# One BLAS/OpenMP thread per process: gunicorn already spreads workers across the cores,
+# and a thread pool in every worker would oversubscribe them. Must be set before numpy loads.
+for var in ('OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'OMP_NUM_THREADS'):
+    os.environ.setdefault(var, '1')
+
+import functools
+import hashlib
+import hmac
+from flask import Flask, Response, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 import joblib
 import numpy as np
+import orjson
 from flask_cors import CORS
-import pandas as pd
-import os
+import csv
 from pathlib import Path
 import logging
+import logging.handlers
+import atexit
+import queue
+import threading
+import time
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.middleware.proxy_fix import ProxyFix
 
-# Setup logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+# Setup logging: request threads only enqueue records, a listener thread does the I/O
+log_listener = None
+log_handlers = None
+
+def start_log_listener():
+    """Route root logging through a queue drained by a background listener"""
+    global log_listener, log_handlers
+    root = logging.getLogger()
+    if log_handlers is None:
+        # Keep any existing root config (e.g. gunicorn --log-config); like basicConfig,
+        # only fall back to our own stderr handler when there is none.
+        # Forked children inherit this list, not the parent's QueueHandler.
+        log_handlers = list(root.handlers)
+        if not log_handlers:
+            stream_handler = logging.StreamHandler()
+            stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+            log_handlers = [stream_handler]
+            root.setLevel(logging.INFO)
+    log_queue = queue.Queue(-1)
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    log_listener = logging.handlers.QueueListener(log_queue, *log_handlers, respect_handler_level=True)
+    log_listener.start()
+
+def stop_log_listener():
+    """Flush queued log records on shutdown"""
+    if log_listener is not None:
+        log_listener.stop()
+
+start_log_listener()
+os.register_at_fork(after_in_child=start_log_listener)
+atexit.register(stop_log_listener)
 logger = logging.getLogger(__name__)
 
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson for faster request/response (de)serialization"""
+
+    def dumps(self, obj, **kwargs):
+        try:
+            return orjson.dumps(obj, default=self.default, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+        except orjson.JSONEncodeError:
+            # orjson rejects values the stdlib accepts, e.g. ints wider than 64 bits
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 # Initialize Flask app
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 CORS(app, origins=['*'], methods=['GET', 'POST', 'OPTIONS'])  # Allow all origins for development
 
@@ -30,11 +87,11 @@ def load_model_safely():
     global model
     try:
         if MODEL_PATH.exists():
-            model = joblib.load(MODEL_PATH)
+            model = joblib.load(MODEL_PATH, mmap_mode='r')
             logger.info("✅ Primary model loaded successfully!")
             return True
         elif FALLBACK_MODEL_PATH.exists():
-            model = joblib.load(FALLBACK_MODEL_PATH)
+            model = joblib.load(FALLBACK_MODEL_PATH, mmap_mode='r')
             logger.info("✅ Fallback model loaded successfully!")
             return True
         else:
@@ -56,8 +113,8 @@ def load_encoder_safely():
     global medication_map
     try:
         if ENCODER_PATH.exists():
-            encoder_df = pd.read_csv(ENCODER_PATH)
-            medication_map = dict(zip(encoder_df['medication'], encoder_df['encoded_value']))
+            with open(ENCODER_PATH, newline='') as f:
+                medication_map = {row['medication']: int(row['encoded_value']) for row in csv.DictReader(f)}
             logger.info("✅ Medication encoder loaded successfully!")
             logger.info(f"Available medications: {list(medication_map.keys())}")
             return True
@@ -83,36 +140,176 @@ def load_encoder_safely():
         return False
 
 encoder_loaded = load_encoder_safely()
+AVAILABLE_MEDS = list(medication_map.keys())
+
+def build_recommendations():
+    """Precompute recommendation text for every medication and risk bucket"""
+    return {
+        med: {
+            'high': f"High risk detected. Consider alternative to {med} or reduce dosage. Monitor closely.",
+            'mod': f"Moderate risk. Monitor patient closely while on {med}.",
+            'low': f"Low risk. {med} appears safe for this patient profile."
+        }
+        for med in medication_map
+    }
+
+RECOMMENDATIONS = build_recommendations()
+
+# Gender encoding (0 for Male, 1 otherwise); exact spellings skip the lower() call
+GENDER_CODES = {
+    'male': 0, 'm': 0, 'Male': 0, 'M': 0, 'MALE': 0,
+    'female': 1, 'f': 1, 'Female': 1, 'F': 1, 'FEMALE': 1
+}
+
+# Static endpoint bodies, serialized once instead of on every request
+HOME_BODY = orjson.dumps({'message': 'Drug Risk Prediction API', 'status': 'running', 'port': os.environ.get("PORT", 5001)})
+HOME_ETAG = hashlib.md5(HOME_BODY).hexdigest()
+HEALTH_BODY = b''
+MEDICATIONS_BODY = b''
+
+def build_status_bodies():
+    """Serialize the /health and /medications responses; rerun after reloading the model or encoder"""
+    global HEALTH_BODY, MEDICATIONS_BODY
+    HEALTH_BODY = orjson.dumps({
+        'status': 'API is running',
+        'model_loaded': model is not None,
+        'encoder_loaded': encoder_loaded,
+        'model_path_exists': MODEL_PATH.exists(),
+        'fallback_path_exists': FALLBACK_MODEL_PATH.exists(),
+        'available_medications': AVAILABLE_MEDS,
+        'medication_count': len(medication_map),
+        'port': os.environ.get("PORT", 5001)
+    })
+    MEDICATIONS_BODY = orjson.dumps({
+        'medications': AVAILABLE_MEDS,
+        'count': len(medication_map)
+    })
+
+build_status_bodies()
+
+# Micro-batching: concurrent requests are coalesced into one predict_proba call
+# A gunicorn worker queues at most one request per thread, so the batch size
+# follows the thread count (Procfile: --threads ${BATCH_THREADS:-64})
+MAX_BATCH = int(os.environ.get('BATCH_THREADS', 64))
+MAX_WAIT_MS = 20
+PREDICT_TIMEOUT = 30
+FEATURE_DTYPE = np.float32  # float32 halves memory traffic compared to float64
+prediction_queue = None
+# Reused by the batch worker; row slices of a C-contiguous buffer stay contiguous
+BATCH_BUF = np.empty((MAX_BATCH, 5), dtype=FEATURE_DTYPE)
+
+def batch_worker():
+    """Collect queued feature rows and run them through the model as one batch"""
+    while True:
+        items = [prediction_queue.get()]
+        deadline = time.monotonic() + MAX_WAIT_MS / 1000
+        while len(items) < MAX_BATCH:
+            try:
+                items.append(prediction_queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            # A lone request runs immediately; only wait for stragglers when under load
+            remaining = deadline - time.monotonic()
+            if len(items) == 1 or remaining <= 0:
+                break
+            try:
+                items.append(prediction_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        try:
+            # Rows are plain tuples copied into the preallocated buffer
+            for i, (row, _, _) in enumerate(items):
+                BATCH_BUF[i] = row
+            batch = BATCH_BUF[:len(items)]
+            # One predict_proba call gives both outputs; argmax over classes_ matches model.predict
+            probabilities = model.predict_proba(batch)
+            labels = model.classes_[probabilities.argmax(axis=1)]
+            for (_, done, result), prob, label in zip(items, probabilities[:, 1], labels):
+                result['risk_prob'] = float(prob)
+                result['risk_prediction'] = int(label)
+                done.set()
+        except Exception as e:
+            logger.error(f"Batch prediction failed for {len(items)} requests: {e}")
+            for _, done, result in items:
+                result['error'] = e
+                done.set()
+
+def predict_batched(features):
+    """Queue a single feature tuple for batched inference and wait for (risk_prob, risk_prediction)"""
+    done = threading.Event()
+    result = {}
+    prediction_queue.put((features, done, result))
+    if not done.wait(PREDICT_TIMEOUT):
+        raise TimeoutError(f"Prediction timed out after {PREDICT_TIMEOUT}s")
+    if 'error' in result:
+        raise result['error']
+    return result['risk_prob'], result['risk_prediction']
+
+def start_batch_worker():
+    """Start the batching thread with a fresh queue in the current process"""
+    global prediction_queue
+    prediction_queue = queue.Queue()
+    threading.Thread(target=batch_worker, name='prediction-batcher', daemon=True).start()
+
+# Threads do not survive fork, so gunicorn --preload workers start their own
+start_batch_worker()
+os.register_at_fork(after_in_child=start_batch_worker)
+
+# Prediction cache (per worker process); repeated inputs skip the batch queue
+PREDICTION_CACHE_SIZE = 8192
+# /cache/clear is disabled unless this token is set and sent as X-Admin-Token
+CACHE_ADMIN_TOKEN = os.environ.get('CACHE_ADMIN_TOKEN')
+
+@functools.lru_cache(maxsize=PREDICTION_CACHE_SIZE)
+def infer_risk(gender, age, med_encoded, dose, duration):
+    """Return (risk_prob, risk_prediction) for an encoded patient profile"""
+    # Feature row [sex, age, med, dose, time]
+    return predict_batched((gender, age, med_encoded, dose, duration))
+
+def cache_hit_rate():
+    """Fraction of infer_risk calls served from this worker's cache"""
+    info = infer_risk.cache_info()
+    total = info.hits + info.misses
+    return info.hits / total if total else 0.0
 
 @app.before_request
 def log_request():
     """Log all incoming requests"""
-    logger.info(f"Request: {request.method} {request.path} from {request.remote_addr}")
+    logger.info("Request: %s %s from %s", request.method, request.path, request.remote_addr)
 
 @app.after_request
 def log_response(response):
     """Log all outgoing responses"""
-    logger.info(f"Response: {response.status_code} for {request.method} {request.path}")
+    logger.info("Response: %s for %s %s", response.status_code, request.method, request.path)
     return response
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Enhanced health check endpoint"""
-    return jsonify({
-        'status': 'API is running',
-        'model_loaded': model is not None,
-        'encoder_loaded': encoder_loaded,
-        'model_path_exists': MODEL_PATH.exists(),
-        'fallback_path_exists': FALLBACK_MODEL_PATH.exists(),
-        'available_medications': list(medication_map.keys()),
-        'medication_count': len(medication_map),
-        'port': os.environ.get("PORT", 5001)
-    })
+    return Response(HEALTH_BODY, 200, mimetype='application/json')
 
 @app.route('/', methods=['GET'])
 def home():
     """Basic home endpoint"""
-    return jsonify({'message': 'Drug Risk Prediction API', 'status': 'running', 'port': os.environ.get("PORT", 5001)})
+    response = Response(HOME_BODY, 200, mimetype='application/json')
+    response.set_etag(HOME_ETAG)
+    return response.make_conditional(request)
+
+MAX_PREDICT_BODY = 4096
+
+def read_body(limit):
+    """Read at most limit + 1 bytes of the request body, looping over short reads"""
+    chunks = []
+    remaining = limit + 1
+    while remaining > 0:
+        chunk = request.stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
 
 @app.route('/predict', methods=['POST'])
 def predict():
@@ -121,8 +318,22 @@ def predict():
         if model is None:
             logger.error("Model not loaded for prediction request")
             return jsonify({'error': 'Model not loaded'}), 500
-            
-        data = request.get_json()
+
+        # Reject oversized or malformed bodies before doing any parsing work.
+        # Reading one byte past the limit also catches chunked bodies, which
+        # have no Content-Length.
+        if (request.content_length or 0) > MAX_PREDICT_BODY:
+            raise RequestEntityTooLarge()
+        raw = read_body(MAX_PREDICT_BODY)
+        if len(raw) > MAX_PREDICT_BODY:
+            raise RequestEntityTooLarge()
+        try:
+            data = orjson.loads(raw) if request.is_json else None
+        except orjson.JSONDecodeError:
+            data = None
+        if not isinstance(data, dict):
+            logger.warning("Invalid JSON body in prediction request")
+            return jsonify({'error': 'Invalid JSON body'}), 400
         
         # Validate required fields
         required_fields = ['gender', 'age', 'medication', 'dose', 'duration']
@@ -132,22 +343,23 @@ def predict():
                 return jsonify({'error': f'Missing required field: {field}'}), 400
         
         # Process input data
-        gender = 0 if data['gender'].lower() in ['male', 'm'] else 1
+        gender = GENDER_CODES.get(data['gender'])
+        if gender is None:
+            gender = GENDER_CODES.get(data['gender'].lower(), 1)
         age = int(data['age'])
         medication_name = data['medication']
         dose = int(data['dose'])
         duration = int(data['duration'])
         
-        # Validate medication
-        if medication_name not in medication_map:
+        # Validate and encode medication with a single lookup
+        med_encoded = medication_map.get(medication_name)
+        if med_encoded is None:
             logger.warning(f"Invalid medication requested: {medication_name}")
             return jsonify({
                 'error': f'Invalid medication: {medication_name}',
-                'available_medications': list(medication_map.keys())
+                'available_medications': AVAILABLE_MEDS
             }), 400
         
-        med_encoded = medication_map[medication_name]
-        
         # Validate ranges
         if age < 0 or age > 120:
             logger.warning(f"Invalid age: {age}")
@@ -159,15 +371,14 @@ def predict():
             logger.warning(f"Invalid duration: {duration}")
             return jsonify({'error': 'Duration must be positive'}), 400
         
-        # Create feature array [sex, age, med, dose, time]
-        features = np.array([[gender, age, med_encoded, dose, duration]])
-        
         # Make prediction with error handling
         try:
-            risk_prob = model.predict_proba(features)[0][1]
-            risk_prediction = model.predict(features)[0]
+            risk_prob, risk_prediction = infer_risk(gender, age, med_encoded, dose, duration)
             risk_label = 'HIGH RISK' if risk_prediction == 1 else 'LOW RISK'
-            logger.info(f"Prediction successful: {risk_label} (prob: {risk_prob:.4f})")
+            # Hit rate takes the lru_cache lock, so only compute it when the line is emitted
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Prediction successful: %s (prob: %.4f, worker %s cache hit rate: %.2f%%)",
+                            risk_label, risk_prob, os.getpid(), cache_hit_rate() * 100)
         except Exception as pred_error:
             logger.error(f"Model prediction failed: {pred_error}")
             return jsonify({'error': f'Model prediction failed: {str(pred_error)}'}), 500
@@ -182,19 +393,21 @@ def predict():
                 'duration': duration
             },
             'prediction': {
-                'risk_probability': round(float(risk_prob), 4),
+                'risk_probability': round(risk_prob, 4),
                 'risk_label': risk_label,
                 'risk_score': int(risk_prediction),
-                'confidence': round(float(max(risk_prob, 1 - risk_prob)), 4)
+                'confidence': round(max(risk_prob, 1 - risk_prob), 4)
             },
             'interpretation': {
                 'message': f"The patient has a {risk_label.lower()} of adverse drug reactions.",
-                'recommendation': get_recommendation(float(risk_prob), medication_name)
+                'recommendation': get_recommendation(risk_prob, medication_name)
             }
         }
         
         return jsonify(response)
         
+    except RequestEntityTooLarge:
+        raise
     except ValueError as e:
         logger.error(f"ValueError in prediction: {e}")
         return jsonify({'error': f'Invalid input format: {str(e)}'}), 400
@@ -204,23 +417,42 @@ def predict():
 
 @app.route('/medications', methods=['GET'])
 def get_medications():
+    return Response(MEDICATIONS_BODY, 200, mimetype='application/json')
+
+@app.route('/cache/clear', methods=['POST'])
+def clear_cache():
+    """Clear the prediction cache of the worker process serving this request only"""
+    if not CACHE_ADMIN_TOKEN:
+        return jsonify({'error': 'Endpoint not found'}), 404
+    # Compare bytes: compare_digest raises TypeError on non-ASCII str
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode(), CACHE_ADMIN_TOKEN.encode()):
+        logger.warning(f"Rejected cache clear from {request.remote_addr}")
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    info = infer_risk.cache_info()
+    logger.info(f"Clearing worker {os.getpid()} prediction cache: {info.hits} hits, {info.misses} misses, {info.currsize} entries (hit rate: {cache_hit_rate():.2%})")
+    infer_risk.cache_clear()
     return jsonify({
-        'medications': list(medication_map.keys()),
-        'count': len(medication_map)
+        'status': 'worker cache cleared',
+        'worker_pid': os.getpid(),
+        'hits': info.hits,
+        'misses': info.misses,
+        'entries': info.currsize
     })
 
 def get_recommendation(risk_prob, medication):
-    if risk_prob >= 0.7:
-        return f"High risk detected. Consider alternative to {medication} or reduce dosage. Monitor closely."
-    elif risk_prob >= 0.3:
-        return f"Moderate risk. Monitor patient closely while on {medication}."
-    else:
-        return f"Low risk. {medication} appears safe for this patient profile."
+    bucket = 'high' if risk_prob >= 0.7 else 'mod' if risk_prob >= 0.3 else 'low'
+    return RECOMMENDATIONS[medication][bucket]
 
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({'error': 'Endpoint not found'}), 404
 
+@app.errorhandler(413)
+def payload_too_large(error):
+    logger.warning(f"Payload too large for {request.path} (limit {MAX_PREDICT_BODY} bytes)")
+    return jsonify({'error': 'Payload too large'}), 413
+
 @app.errorhandler(500)
 def internal_error(error):
     logger.error(f"Internal server error: {error}")
@@ -231,9 +463,10 @@ if __name__ == '__main__':
     print("=" * 50)
     print(f"Model path: {MODEL_PATH}")
     print(f"Model loaded: {model is not None}")
-    print(f"Available medications: {list(medication_map.keys())}")
+    print(f"Available medications: {AVAILABLE_MEDS}")
     print("=" * 50)
 
+    # Local development only; production runs under gunicorn (see Procfile)
     # Use Render-assigned port or fallback to 5001
     port = int(os.environ.get("PORT", 5001))
     print(f"Starting Flask server on port {port}...")
@@ -4,6 +4,7 @@ Backend Health Monitor
 Monitors backend health and automatically restarts on failures
 """
 import requests
+from requests.adapters import HTTPAdapter
 import time
 import subprocess
 import logging
@@ -28,11 +29,14 @@ class BackendMonitor:
         self.failure_count = 0
         self.max_failures = 3
         self.backend_process = None
+        # Reuse one keep-alive connection for the periodic health probes
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
         
     def check_health(self):
         """Check if backend is responding"""
         try:
-            response = requests.get(f"{self.api_url}/health", timeout=10)
+            response = self.session.get(f"{self.api_url}/health", timeout=10)
             if response.status_code == 200:
                 data = response.json()
                 if data.get('model_loaded') and data.get('status') == 'API is running':
@@ -166,6 +170,7 @@ class BackendMonitor:
     
     def cleanup(self):
         """Cleanup resources"""
+        self.session.close()
         if self.backend_process:
             try:
                 self.backend_process.terminate()
@@ -86,11 +86,12 @@ def predict_risk(gender, age, medication, dose, duration):
             raise ValueError(f"Invalid medication. Available: {available_meds}")
         
         # Create feature array
-        features = np.array([[gender_encoded, age, med_encoded, dose, duration]])
+        features = np.asarray([[gender_encoded, age, med_encoded, dose, duration]], dtype=np.float32)
         
         # Make prediction
-        prob = model.predict_proba(features)[0][1]
-        prediction = model.predict(features)[0]
+        proba = model.predict_proba(features)[0]
+        prediction = model.classes_[proba.argmax()]
+        prob = proba[1]
         
         # Determine risk label
         label = "HIGH RISK" if prediction == 1 else "LOW RISK"
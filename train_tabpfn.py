@@ -96,7 +96,8 @@ def train_tabpfn_model():
         os.makedirs(model_dir, exist_ok=True)
         
         model_path = f'{model_dir}/tabpfn_model.pkl'
-        joblib.dump(classifier, model_path)
+        # Saved uncompressed so the API can joblib.load(..., mmap_mode='r') it
+        joblib.dump(classifier, model_path, compress=0)
         print(f"💾 Model saved to: {model_path}")
         
         return classifier, accuracy